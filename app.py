@@ -1,25 +1,72 @@
 #!/usr/bin/env python3
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response
 from flask_cors import CORS
 from device_manager import DeviceManager
+from profiler import Profiler, dump_thread_stacks
 import os
 from dotenv import load_dotenv
 import io
 import json
+import secrets
+from functools import wraps
 
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app)
 
+# TLS 設定（MQTT_TLS=true 時啟用，全體設備共用同一個 SSLContext）
+tls_config = None
+if os.getenv('MQTT_TLS', 'false').lower() == 'true':
+    tls_config = {
+        'ca_certs': os.getenv('MQTT_TLS_CA', ''),
+        'certfile': os.getenv('MQTT_TLS_CERT', ''),
+        'keyfile': os.getenv('MQTT_TLS_KEY', ''),
+        'insecure': os.getenv('MQTT_TLS_INSECURE', 'false').lower() == 'true',
+        'session_resumption': os.getenv('MQTT_TLS_SESSION_RESUMPTION', 'true').lower() == 'true'
+    }
+
 # 初始化設備管理器
 manager = DeviceManager(
     broker=os.getenv('MQTT_BROKER', 'localhost'),
     port=int(os.getenv('MQTT_PORT', 1883)),
     username=os.getenv('MQTT_USERNAME', ''),
-    password=os.getenv('MQTT_PASSWORD', '')
+    password=os.getenv('MQTT_PASSWORD', ''),
+    probe_enabled=os.getenv('PROBE_ENABLED', 'false').lower() == 'true',
+    brokers=os.getenv('MQTT_BROKERS', ''),
+    tls=tls_config
 )
 
+# 診斷工具（需設定 PROFILING_TOKEN 才會開放 /api/debug/* 端點）
+profiler = Profiler()
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '')
+
+def require_profiling_token(view):
+    """驗證診斷端點的存取權杖（Authorization: Bearer <token>）"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not PROFILING_TOKEN:
+            return jsonify({'success': False, 'error': '診斷功能未啟用'}), 404
+        auth = request.headers.get('Authorization', '')
+        token = auth[7:] if auth.startswith('Bearer ') else ''
+        if not secrets.compare_digest(token.encode('utf-8'), PROFILING_TOKEN.encode('utf-8')):
+            return jsonify({'success': False, 'error': '未授權'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+def conditional_json(etag, build):
+    """依 If-None-Match 回傳 304，或以 build() 產生 JSON 並附加 ETag
+
+    ETag 需在產生內容前取得：若期間資料變更，回傳的 ETag 較舊，下次請求仍會取得新內容。
+    """
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/')
 def index():
     """首頁"""
@@ -27,8 +74,8 @@ def index():
 
 @app.route('/api/models', methods=['GET'])
 def get_models():
-    """取得支援的設備型號"""
-    return jsonify({
+    """取得支援的設備型號（支援 ETag / If-None-Match）"""
+    return conditional_json(manager.get_models_etag(), lambda: {
         'success': True,
         'models': manager.get_supported_models()
     })
@@ -40,8 +87,9 @@ def add_model():
     model = data.get('model')
     fw_version = data.get('fw_version')
     series = data.get('series')
+    payload = data.get('payload')
 
-    success, error = manager.add_model(model, fw_version, series)
+    success, error = manager.add_model(model, fw_version, series, payload)
     if error:
         return jsonify({'success': False, 'error': error}), 400
 
@@ -103,10 +151,12 @@ def get_devices():
     """
     # 檢查是否使用分頁
     use_pagination = request.args.get('use_pagination', 'true').lower() != 'false'
+    # ETag 需在讀取設備狀態前取得
+    etag = manager.get_devices_etag()
     
     if not use_pagination:
         # 不分頁，返回所有設備（警告：大量設備時可能很慢）
-        return jsonify({
+        return conditional_json(f"{etag}-all", lambda: {
             'success': True,
             'devices': manager.get_all_status()
         })
@@ -118,11 +168,9 @@ def get_devices():
     # 限制 page_size 最多 100
     page_size = min(max(1, page_size), 100)
     
-    paginated_result = manager.get_paginated_status(page, page_size)
-    
-    return jsonify({
+    return conditional_json(f"{etag}-p{page}-{page_size}", lambda: {
         'success': True,
-        **paginated_result  # 展開分頁結果
+        **manager.get_paginated_status(page, page_size)  # 展開分頁結果
     })
 
 @app.route('/api/devices', methods=['POST'])
@@ -250,6 +298,205 @@ def remove_all_devices():
         'removed_count': count
     })
 
+@app.route('/api/brokers', methods=['GET'])
+def get_brokers():
+    """取得各 Broker 的分配、連線與吞吐量統計，以及 TLS 握手統計"""
+    return jsonify({
+        'success': True,
+        'brokers': manager.get_broker_stats(),
+        'tls': manager.get_tls_stats()
+    })
+
+@app.route('/api/brokers', methods=['POST'])
+def add_broker():
+    """新增 Broker 端點（設備會依一致性雜湊重新平衡）"""
+    data = request.json or {}
+    moved, error = manager.add_broker(data)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+
+    return jsonify({
+        'success': True,
+        'moved_count': moved,
+        'brokers': manager.get_broker_stats()
+    })
+
+@app.route('/api/brokers/<path:name>/drain', methods=['POST'])
+def drain_broker(name):
+    """排空 Broker 端點（設備移至其他端點）"""
+    moved, error = manager.drain_broker(name)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+
+    return jsonify({
+        'success': True,
+        'moved_count': moved,
+        'brokers': manager.get_broker_stats()
+    })
+
+@app.route('/api/brokers/<path:name>', methods=['DELETE'])
+def remove_broker(name):
+    """移除已排空的 Broker 端點"""
+    success, error = manager.remove_broker(name)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+
+    return jsonify({
+        'success': True,
+        'brokers': manager.get_broker_stats()
+    })
+
+@app.route('/api/probe', methods=['GET'])
+def get_probe_stats():
+    """取得端到端探測統計（遺失、重複、亂序、延遲百分位數）"""
+    return jsonify({
+        'success': True,
+        'probe': manager.get_probe_stats()
+    })
+
+@app.route('/api/probe/start', methods=['POST'])
+def start_probe():
+    """啟用探測模式"""
+    success, error = manager.enable_probe()
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+
+    return jsonify({
+        'success': True,
+        'probe': manager.get_probe_stats()
+    })
+
+@app.route('/api/probe/stop', methods=['POST'])
+def stop_probe():
+    """停用探測模式"""
+    manager.disable_probe()
+    return jsonify({'success': True})
+
+@app.route('/api/probe/reset', methods=['POST'])
+def reset_probe():
+    """清除探測統計"""
+    success, error = manager.reset_probe()
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+
+    return jsonify({'success': True})
+
+@app.route('/api/debug/profile', methods=['GET'])
+@require_profiling_token
+def get_profiler_status():
+    """取得分析器狀態"""
+    return jsonify({
+        'success': True,
+        'profiler': profiler.get_status()
+    })
+
+@app.route('/api/debug/profile/cpu/start', methods=['POST'])
+@require_profiling_token
+def start_cpu_profile():
+    """開始取樣式 CPU 分析"""
+    data = request.get_json(silent=True) or {}
+    success, error = profiler.start_cpu(
+        data.get('duration', 30),
+        data.get('interval', Profiler.DEFAULT_INTERVAL)
+    )
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+
+    return jsonify({
+        'success': True,
+        'profiler': profiler.get_status()
+    })
+
+@app.route('/api/debug/profile/cpu/stop', methods=['POST'])
+@require_profiling_token
+def stop_cpu_profile():
+    """停止 CPU 分析"""
+    success, error = profiler.stop_cpu()
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+
+    return jsonify({
+        'success': True,
+        'profiler': profiler.get_status()
+    })
+
+@app.route('/api/debug/profile/cpu/download', methods=['GET'])
+@require_profiling_token
+def download_cpu_profile():
+    """下載 CPU 分析結果（collapsed stack 格式）"""
+    result = profiler.get_cpu_result()
+    if result is None:
+        return jsonify({'success': False, 'error': '尚無 CPU 分析結果'}), 404
+
+    return send_file(
+        io.BytesIO(result.encode('utf-8')),
+        mimetype='text/plain',
+        as_attachment=True,
+        download_name='cpu_profile.folded'
+    )
+
+@app.route('/api/debug/profile/memory/start', methods=['POST'])
+@require_profiling_token
+def start_memory_profile():
+    """開始 tracemalloc 記憶體分析"""
+    data = request.get_json(silent=True) or {}
+    success, error = profiler.start_memory(
+        data.get('duration', 60),
+        data.get('frames', 10)
+    )
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+
+    return jsonify({
+        'success': True,
+        'profiler': profiler.get_status()
+    })
+
+@app.route('/api/debug/profile/memory/stop', methods=['POST'])
+@require_profiling_token
+def stop_memory_profile():
+    """停止記憶體分析"""
+    success, error = profiler.stop_memory()
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+
+    return jsonify({
+        'success': True,
+        'profiler': profiler.get_status()
+    })
+
+@app.route('/api/debug/profile/memory/download', methods=['GET'])
+@require_profiling_token
+def download_memory_profile():
+    """下載記憶體分析結果"""
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({'success': False, 'error': '參數格式不正確'}), 400
+    limit = min(max(1, limit), 500)
+    result = profiler.get_memory_result(limit)
+    if result is None:
+        return jsonify({'success': False, 'error': '尚無記憶體分析結果'}), 404
+
+    data = json.dumps(result, ensure_ascii=False, indent=2)
+    return send_file(
+        io.BytesIO(data.encode('utf-8')),
+        mimetype='application/json',
+        as_attachment=True,
+        download_name='memory_profile.json'
+    )
+
+@app.route('/api/debug/threads', methods=['GET'])
+@require_profiling_token
+def dump_threads():
+    """傾印所有執行緒堆疊"""
+    return send_file(
+        io.BytesIO(dump_thread_stacks().encode('utf-8')),
+        mimetype='text/plain',
+        as_attachment=True,
+        download_name='threads.txt'
+    )
+
 if __name__ == '__main__':
     port = int(os.getenv('WEB_PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=True)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+import json
+import time
+import threading
+import hashlib
+import bisect
+from latency_stats import latency_summary
+from collections import deque
+
+
+def _hash(key):
+    """一致性雜湊使用的 64 位元雜湊值"""
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class BrokerEndpoint:
+    """單一 Broker 端點 - 連線上限、權重與統計"""
+
+    # 吞吐量統計視窗（秒）
+    RATE_WINDOW = 60
+    # 保留的連線延遲樣本數
+    LATENCY_SAMPLES = 1000
+
+    def __init__(self, host, port=1883, weight=1, max_connections=None, name=None):
+        self.host = host
+        self.port = port
+        self.weight = weight
+        self.max_connections = max_connections
+        self.name = name or f"{host}:{port}"
+        self.draining = False
+        self.assigned = set()
+        self.lock = threading.Lock()
+        self.connects = 0
+        self.connect_failures = 0
+        self.disconnects = 0
+        self.messages = 0
+        self.bytes = 0
+        self.publish_errors = 0
+        self.connect_latencies = deque(maxlen=self.LATENCY_SAMPLES)
+        self._rate_buckets = deque()
+        self._created_at = time.monotonic()
+
+    @classmethod
+    def from_dict(cls, data):
+        """由設定 dict 建立端點，格式錯誤時拋出 ValueError"""
+        if not isinstance(data, dict):
+            raise ValueError("Broker 設定必須為物件")
+        host = data.get('host')
+        if not isinstance(host, str) or not host.strip():
+            raise ValueError("Broker 缺少 host")
+        try:
+            port = int(data.get('port', 1883))
+            weight = int(data.get('weight', 1))
+            max_connections = data.get('max_connections')
+            max_connections = int(max_connections) if max_connections is not None else None
+        except (TypeError, ValueError):
+            raise ValueError(f"Broker {host} 的 port/weight/max_connections 必須為整數")
+        if weight < 1:
+            raise ValueError(f"Broker {host} 的 weight 必須大於 0")
+        if max_connections is not None and max_connections < 0:
+            raise ValueError(f"Broker {host} 的 max_connections 不可為負數")
+        name = data.get('name')
+        return cls(host.strip(), port, weight, max_connections, name if isinstance(name, str) and name else None)
+
+    def has_capacity(self):
+        return self.max_connections is None or len(self.assigned) < self.max_connections
+
+    def record_connect(self, latency, success):
+        """記錄連線結果（latency 為秒，自動重新連線時為 None）"""
+        with self.lock:
+            if success:
+                self.connects += 1
+                if latency is not None:
+                    self.connect_latencies.append(latency * 1000.0)
+            else:
+                self.connect_failures += 1
+
+    def record_disconnect(self):
+        with self.lock:
+            self.disconnects += 1
+
+    def record_publish_error(self):
+        with self.lock:
+            self.publish_errors += 1
+
+    def connect_latency_samples(self):
+        """取得連線延遲樣本（毫秒）"""
+        with self.lock:
+            return list(self.connect_latencies)
+
+    def record_publish(self, size):
+        """記錄已發送的訊息（以每秒為單位累計吞吐量）"""
+        second = int(time.monotonic())
+        with self.lock:
+            self.messages += 1
+            self.bytes += size
+            buckets = self._rate_buckets
+            if buckets and buckets[-1][0] == second:
+                buckets[-1][1] += 1
+            else:
+                buckets.append([second, 1])
+                while buckets[0][0] <= second - self.RATE_WINDOW:
+                    buckets.popleft()
+
+    def get_stats(self, connected=0):
+        """取得端點統計"""
+        now = time.monotonic()
+        with self.lock:
+            floor = int(now) - self.RATE_WINDOW
+            recent = sum(count for second, count in self._rate_buckets if second > floor)
+            window = min(self.RATE_WINDOW, max(1.0, now - self._created_at))
+            return {
+                'name': self.name,
+                'host': self.host,
+                'port': self.port,
+                'weight': self.weight,
+                'max_connections': self.max_connections,
+                'draining': self.draining,
+                'assigned': len(self.assigned),
+                'connected': connected,
+                'connects': self.connects,
+                'connect_failures': self.connect_failures,
+                'disconnects': self.disconnects,
+                'messages': self.messages,
+                'bytes': self.bytes,
+                'publish_errors': self.publish_errors,
+                'messages_per_sec': round(recent / window, 3),
+                'connect_latency_ms': latency_summary(self.connect_latencies)
+            }
+
+
+class BrokerPool:
+    """Broker 叢集 - 以 MAC 一致性雜湊分配設備，並遵守各端點連線上限
+
+    每個端點依權重在雜湊環上放置 VIRTUAL_NODES * weight 個虛擬節點。
+    設備優先分配到環上順時針第一個可用端點；該端點已滿或排空中時往下一個端點遞補。
+    """
+
+    VIRTUAL_NODES = 100
+
+    def __init__(self, endpoints):
+        self.endpoints = {}
+        self._ring = []
+        self._ring_keys = []
+        for endpoint in endpoints:
+            if endpoint.name in self.endpoints:
+                raise ValueError(f"Broker 名稱重複: {endpoint.name}")
+            self.endpoints[endpoint.name] = endpoint
+        if not self.endpoints:
+            raise ValueError("至少需要一個 Broker")
+        self._rebuild_ring()
+
+    @staticmethod
+    def parse(spec):
+        """解析 Broker 清單（JSON 字串或 list），回傳 BrokerEndpoint 列表"""
+        if isinstance(spec, str):
+            try:
+                spec = json.loads(spec)
+            except ValueError:
+                raise ValueError("Broker 清單必須為 JSON 陣列")
+        if not isinstance(spec, list):
+            raise ValueError("Broker 清單必須為陣列")
+        return [BrokerEndpoint.from_dict(item) for item in spec]
+
+    def _rebuild_ring(self):
+        ring = []
+        for endpoint in self.endpoints.values():
+            for i in range(self.VIRTUAL_NODES * endpoint.weight):
+                ring.append((_hash(f"{endpoint.name}#{i}"), endpoint.name))
+        ring.sort()
+        self._ring = ring
+        self._ring_keys = [key for key, _ in ring]
+
+    def _walk(self, mac):
+        """依雜湊環順序列出 MAC 的候選端點（不重複）"""
+        start = bisect.bisect(self._ring_keys, _hash(mac))
+        seen = set()
+        count = len(self._ring)
+        for i in range(count):
+            name = self._ring[(start + i) % count][1]
+            if name not in seen:
+                seen.add(name)
+                yield self.endpoints[name]
+                if len(seen) == len(self.endpoints):
+                    return
+
+    def preferred(self, mac):
+        """不考慮連線上限時 MAC 應分配到的端點（排空中的端點除外）"""
+        for endpoint in self._walk(mac):
+            if not endpoint.draining:
+                return endpoint
+        return None
+
+    def locate(self, mac):
+        """找出 MAC 可分配的端點（跳過排空中與已滿的端點）"""
+        for endpoint in self._walk(mac):
+            if not endpoint.draining and (mac in endpoint.assigned or endpoint.has_capacity()):
+                return endpoint
+        return None
+
+    def assign(self, mac):
+        """分配端點，所有端點皆不可用時回傳 None"""
+        endpoint = self.locate(mac)
+        if endpoint is not None:
+            endpoint.assigned.add(mac)
+        return endpoint
+
+    def release(self, mac):
+        """釋放 MAC 的分配"""
+        for endpoint in self.endpoints.values():
+            endpoint.assigned.discard(mac)
+
+    def owner(self, mac):
+        for endpoint in self.endpoints.values():
+            if mac in endpoint.assigned:
+                return endpoint
+        return None
+
+    def add(self, endpoint):
+        if endpoint.name in self.endpoints:
+            raise ValueError(f"Broker 已存在: {endpoint.name}")
+        self.endpoints[endpoint.name] = endpoint
+        self._rebuild_ring()
+
+    def drain(self, name):
+        """標記端點為排空中（不再分配新設備，既有設備於重新平衡時移出）"""
+        endpoint = self.endpoints.get(name)
+        if endpoint is None:
+            raise ValueError(f"Broker 不存在: {name}")
+        endpoint.draining = True
+        return endpoint
+
+    def remove(self, name):
+        endpoint = self.endpoints.get(name)
+        if endpoint is None:
+            raise ValueError(f"Broker 不存在: {name}")
+        if endpoint.assigned:
+            raise ValueError(f"Broker {name} 仍有 {len(endpoint.assigned)} 台設備，請先排空")
+        if len(self.endpoints) == 1:
+            raise ValueError("至少需要保留一個 Broker")
+        del self.endpoints[name]
+        self._rebuild_ring()
+        return endpoint
+
+    def rebalance(self, macs):
+        """重新平衡：回傳需要移動的 [(mac, 新端點)] 並更新分配
+
+        只移動「目前端點正在排空」或「偏好端點已改變且有空位」的設備，
+        其餘設備留在原處，避免不必要的重新連線。
+        """
+        moves = []
+        for mac in sorted(macs, key=_hash):
+            current = self.owner(mac)
+            if current is not None and not current.draining:
+                target = self.preferred(mac)
+                if target is None or target is current or not target.has_capacity():
+                    continue
+            else:
+                if current is not None:
+                    current.assigned.discard(mac)
+                target = self.locate(mac)
+                if target is None:
+                    # 無其他可用端點，維持原分配
+                    if current is not None:
+                        current.assigned.add(mac)
+                    continue
+            if current is not None:
+                current.assigned.discard(mac)
+            target.assigned.add(mac)
+            moves.append((mac, target))
+        return moves
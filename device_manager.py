@@ -8,6 +8,20 @@ from concurrent.futures import ThreadPoolExecutor
 import random
 import secrets
 import os
+import tempfile
+import itertools
+import atexit
+from probe import ProbeMonitor
+from broker_pool import BrokerPool, BrokerEndpoint
+from tls_context import create_fleet_context
+from payload_schema import compile_schema, validate_schema, SchemaError
+
+# 新建檔案的預設權限：於匯入時（尚未啟動其他執行緒）讀取一次 umask，
+# 避免執行期間修改 umask 影響其他執行緒建立的檔案
+_umask = os.umask(0)
+os.umask(_umask)
+DEFAULT_FILE_MODE = 0o666 & ~_umask
+del _umask
 
 class DeviceSimulator:
     """單一設備模擬器"""
@@ -20,6 +34,8 @@ class DeviceSimulator:
         },
     }
     DEVICE_MODELS = dict(DEFAULT_DEVICE_MODELS)
+    # 型號 -> 由 payload schema 編譯的產生函式（無 schema 的型號使用 build_default_payload）
+    PAYLOAD_GENERATORS = {}
 
     @staticmethod
     def get_default_series(model):
@@ -37,7 +53,7 @@ class DeviceSimulator:
         return series if series else 'ZP2'
     
     def __init__(self, device_id, mac, model, fw_version, broker, port, series=None, username='', password='', 
-                 heartbeat_interval=60, data_interval=60):
+                 heartbeat_interval=60, data_interval=60, tls_context=None):
         self.device_id = device_id
         self.mac = mac
         self.model = model
@@ -50,6 +66,8 @@ class DeviceSimulator:
         self.password = password
         self.heartbeat_interval = heartbeat_interval
         self.data_interval = data_interval
+        # 發送間隔的隨機浮動上限（秒），模擬 MCU 不準時
+        self.jitter = 10
         
         self.topic = f"{self.series}/{mac}/data"
         self.client = mqtt.Client(client_id=f"device_{mac}")
@@ -57,24 +75,72 @@ class DeviceSimulator:
         self.client.on_disconnect = self.on_disconnect
         self.running = False
         self.connected = False
+        # 本次執行的停止事件（每次 start 建立新的，舊的發送執行緒不會在重新啟動後繼續執行）
+        self._stop_event = None
+        # 探測模式：由 DeviceManager 設定 ProbeMonitor 後，感測器數據會附加序號與發送時間
+        self.probe = None
+        self.probe_seq = 0
+        # 狀態變更回呼（由 DeviceManager 設定，用於更新設備列表版本）
+        self.on_state_change = None
+        # 所屬 Broker 端點（由 DeviceManager 分配，用於統計吞吐量與連線延遲）
+        self.endpoint = None
+        self._connect_started = None
         
         if self.username:
             self.client.username_pw_set(self.username, self.password)
+        
+        # TLS：使用 DeviceManager 建立的共用 context（含 session 快取）
+        self.tls_context = tls_context
+        if tls_context is not None:
+            self.client.tls_set_context(tls_context)
+    
+    def _notify_state_change(self):
+        if self.on_state_change is not None:
+            self.on_state_change()
+    
+    def _record_connect(self, success):
+        endpoint = self.endpoint
+        if endpoint is None:
+            return
+        # 只有 start() 發起的連線記錄延遲；paho 自動重新連線不計入
+        started = self._connect_started
+        self._connect_started = None
+        endpoint.record_connect(time.monotonic() - started if started is not None else None, success)
     
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
             self.connected = True
+            self._record_connect(True)
+            if self.tls_context is not None:
+                self.tls_context.remember_session(client.socket())
+            self._notify_state_change()
             print(f"[{datetime.now()}] 設備 {self.device_id} ({self.mac}) 已連線")
             # 連線成功後立即發送版本資訊
             self.send_version_info()
         else:
             self.connected = False
+            self._record_connect(False)
+            self._notify_state_change()
             print(f"[{datetime.now()}] 設備 {self.device_id} ({self.mac}) 連線失敗，回傳碼: {rc}")
     
     def on_disconnect(self, client, userdata, rc):
         self.connected = False
+        if self.endpoint is not None:
+            self.endpoint.record_disconnect()
+        self._notify_state_change()
         print(f"[{datetime.now()}] 設備 {self.device_id} ({self.mac}) 已斷線")
     
+    def publish(self, payload):
+        """發送 JSON 訊息到設備 topic 並記錄到所屬 Broker 統計"""
+        data = json.dumps(payload)
+        result = self.client.publish(self.topic, data, qos=0)
+        if self.endpoint is not None:
+            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                self.endpoint.record_publish(len(data))
+            else:
+                self.endpoint.record_publish_error()
+        return result
+    
     def send_version_info(self):
         """發送設備版本資訊 (連線成功時發送一次)"""
         payload = {
@@ -87,13 +153,14 @@ class DeviceSimulator:
             "SWTYPE": "0"
         }
         
-        result = self.client.publish(self.topic, json.dumps(payload), qos=0)
+        result = self.publish(payload)
         if result.rc == mqtt.MQTT_ERR_SUCCESS:
             print(f"[{datetime.now()}] 設備 {self.device_id} 已發送版本資訊")
     
-    def send_sensor_data(self):
-        """發送感測器數據"""
-        payload = {
+    @staticmethod
+    def build_default_payload():
+        """產生預設 (ZP2) 感測器數據"""
+        return {
             "data": {
                 "ts": 0,
                 "t": round(random.uniform(20.0, 30.0), 2),
@@ -122,28 +189,43 @@ class DeviceSimulator:
                 "sa": 10
             }
         }
+    
+    def send_sensor_data(self):
+        """發送感測器數據（型號有 payload schema 時使用其產生函式）"""
+        generator = DeviceSimulator.PAYLOAD_GENERATORS.get(self.model)
+        payload = generator() if generator is not None else self.build_default_payload()
         
-        self.client.publish(self.topic, json.dumps(payload), qos=0)
+        probe = self.probe
+        if probe is not None:
+            seq = self.probe_seq
+            self.probe_seq += 1
+            payload["probe"] = {"seq": seq, "ts": time.time()}
+            broker = self.endpoint.name if self.endpoint is not None else None
+            probe.record_sent(self.mac, self.model, seq, broker)
+        
+        self.publish(payload)
     
     def send_heartbeat(self):
         """發送心跳訊息"""
         payload = {"Heartbeat": "1"}
-        self.client.publish(self.topic, json.dumps(payload), qos=0)
+        self.publish(payload)
     
-    def data_sender_thread(self):
+    def data_sender_thread(self, stop_event):
         """數據發送執行緒"""
-        while self.running:
-            jitter = random.uniform(0, 10)
-            time.sleep(self.data_interval + jitter)
-            if self.running and self.connected:
+        while not stop_event.is_set():
+            jitter = random.uniform(0, self.jitter)
+            if stop_event.wait(self.data_interval + jitter):
+                break
+            if self.connected:
                 self.send_sensor_data()
     
-    def heartbeat_sender_thread(self):
+    def heartbeat_sender_thread(self, stop_event):
         """心跳發送執行緒"""
-        while self.running:
-            jitter = random.uniform(0, 10)
-            time.sleep(self.heartbeat_interval + jitter)
-            if self.running and self.connected:
+        while not stop_event.is_set():
+            jitter = random.uniform(0, self.jitter)
+            if stop_event.wait(self.heartbeat_interval + jitter):
+                break
+            if self.connected:
                 self.send_heartbeat()
     
     def start(self):
@@ -153,12 +235,15 @@ class DeviceSimulator:
         
         try:
             print(f"[{datetime.now()}] 設備 {self.device_id} 嘗試連線到 {self.broker}:{self.port}")
+            self._connect_started = time.monotonic()
             self.client.connect(self.broker, self.port, 60)
             self.running = True
+            self._stop_event = threading.Event()
+            self._notify_state_change()
             
             # 啟動發送執行緒
-            threading.Thread(target=self.data_sender_thread, daemon=True).start()
-            threading.Thread(target=self.heartbeat_sender_thread, daemon=True).start()
+            threading.Thread(target=self.data_sender_thread, args=(self._stop_event,), daemon=True).start()
+            threading.Thread(target=self.heartbeat_sender_thread, args=(self._stop_event,), daemon=True).start()
             
             # 啟動 MQTT 迴圈
             self.client.loop_start()
@@ -166,6 +251,7 @@ class DeviceSimulator:
             return True
             
         except Exception as e:
+            self._record_connect(False)
             print(f"[{datetime.now()}] 設備 {self.device_id} 啟動失敗: {type(e).__name__}: {e}")
             import traceback
             traceback.print_exc()
@@ -177,10 +263,26 @@ class DeviceSimulator:
             return
         
         self.running = False
+        self._stop_event.set()
         self.client.loop_stop()
         self.client.disconnect()
+        self._notify_state_change()
         print(f"[{datetime.now()}] 設備 {self.device_id} ({self.mac}) 已停止")
     
+    def move_to(self, endpoint):
+        """切換到另一個 Broker 端點（執行中的設備會重新連線）"""
+        was_running = self.running
+        self.stop()
+        self.endpoint = endpoint
+        self.broker = endpoint.host
+        self.port = endpoint.port
+        # 停止中的設備不會經過 stop()/start()，仍需更新設備列表版本
+        self._notify_state_change()
+        print(f"[{datetime.now()}] 設備 {self.device_id} ({self.mac}) 移至 Broker {endpoint.name}")
+        if was_running:
+            return self.start()
+        return True
+    
     def get_status(self):
         """取得設備狀態"""
         return {
@@ -191,7 +293,8 @@ class DeviceSimulator:
             'fw_version': self.fw_version,
             'running': self.running,
             'connected': self.connected,
-            'topic': self.topic
+            'topic': self.topic,
+            'broker': self.endpoint.name if self.endpoint is not None else f"{self.broker}:{self.port}"
         }
 
 
@@ -202,7 +305,16 @@ class DeviceManager:
     BATCH_SIZE = 10  # 每個批次最多 10 台設備
     MAX_WORKERS = 5  # 最多 5 個併發執行緒
     
-    def __init__(self, broker, port, username='', password=''):
+    # 型號設定寫入延遲（秒），期間內的多次變更合併為一次寫入
+    MODEL_SAVE_DELAY = 0.5
+    
+    def __init__(self, broker, port, username='', password='', probe_enabled=False, brokers=None, tls=None):
+        """brokers 為選填的 Broker 清單（JSON 字串或 list），
+        每項格式 {"host", "port", "weight", "max_connections", "name"}；未提供時只使用 broker/port
+
+        tls 為選填的 TLS 設定 dict：{"ca_certs", "certfile", "keyfile", "insecure", "ciphers",
+        "session_resumption"}，全體設備共用同一個 SSLContext
+        """
         self.broker = broker
         self.port = port
         self.username = username
@@ -212,53 +324,174 @@ class DeviceManager:
         self.used_macs = set()
         self.lock = threading.RLock()
         self.executor = ThreadPoolExecutor(max_workers=self.MAX_WORKERS, thread_name_prefix='DeviceWorker')
+        self.tls_context = create_fleet_context(**tls) if tls else None
+        if brokers:
+            self.pool = BrokerPool(BrokerPool.parse(brokers))
+        else:
+            self.pool = BrokerPool([BrokerEndpoint(broker, port)])
         self.model_store_path = os.getenv(
             'MODEL_STORE_PATH',
             os.path.join(os.path.dirname(__file__), 'data', 'models.json')
         )
+        # 版本號：型號設定與設備列表變更時遞增，用於 ETag
+        # instance_id 讓重新啟動後的版本號不會與先前的 ETag 衝突
+        self.instance_id = secrets.token_hex(4)
+        self.models_version = 0
+        self._models_snapshot = None
+        self._devices_version_counter = itertools.count(1)
+        self.devices_version = 0
+        # 寫入延遲：磁碟 I/O 在背景執行，不持有 self.lock
+        self._save_lock = threading.Lock()
+        self._save_timer = None
+        self._saved_version = 0
+        atexit.register(self.flush_models)
         self._load_models()
+        self.probe = None
+        if probe_enabled:
+            self.enable_probe()
 
     def _load_models(self):
         """載入型號設定（若無檔案則使用預設）"""
         with self.lock:
             if not os.path.exists(self.model_store_path):
                 DeviceSimulator.DEVICE_MODELS = dict(DeviceSimulator.DEFAULT_DEVICE_MODELS)
-                return
+            else:
+                self._read_models()
 
-            try:
-                with open(self.model_store_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                if isinstance(data, dict):
-                    normalized = {}
-                    for model, value in data.items():
-                        if isinstance(value, str):
-                            normalized[model] = {
-                                'fw_version': value,
-                                'series': DeviceSimulator.get_default_series(model)
-                            }
-                        elif isinstance(value, dict):
-                            fw_version = value.get('fw_version') or value.get('fw')
-                            series = value.get('series') or DeviceSimulator.get_default_series(model)
-                            if isinstance(fw_version, str) and isinstance(series, str):
-                                normalized[model] = {
-                                    'fw_version': fw_version,
-                                    'series': series
-                                }
-                    if normalized:
-                        DeviceSimulator.DEVICE_MODELS = normalized
-                    else:
-                        DeviceSimulator.DEVICE_MODELS = dict(DeviceSimulator.DEFAULT_DEVICE_MODELS)
+            self._models_changed()
+            # 剛載入的設定不需要寫回
+            self._saved_version = self.models_version
+
+    def _read_models(self):
+        """讀取型號設定檔（呼叫者需持有 self.lock）"""
+        try:
+            with open(self.model_store_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                normalized = {}
+                for model, value in data.items():
+                    entry, error = self._normalize_model_entry(model, value)
+                    if error:
+                        # 保留型號與原 schema（避免下次儲存時遺失），產生數據改用預設格式
+                        entry, _ = self._normalize_model_entry(model, dict(value, payload=None))
+                        entry['payload'] = value['payload']
+                        print(f"[{datetime.now()}] 型號 {model} 的 payload schema 無效，改用預設格式: {error}")
+                    if entry:
+                        normalized[model] = entry
+                if normalized:
+                    DeviceSimulator.DEVICE_MODELS = normalized
                 else:
                     DeviceSimulator.DEVICE_MODELS = dict(DeviceSimulator.DEFAULT_DEVICE_MODELS)
-            except Exception:
+            else:
                 DeviceSimulator.DEVICE_MODELS = dict(DeviceSimulator.DEFAULT_DEVICE_MODELS)
+        except Exception:
+            DeviceSimulator.DEVICE_MODELS = dict(DeviceSimulator.DEFAULT_DEVICE_MODELS)
+
+    @staticmethod
+    def _normalize_model_entry(model, value):
+        """正規化單一型號設定
+
+        回傳 (entry, error)；格式不符時 entry 為 None，payload schema 錯誤時回傳錯誤訊息。
+        """
+        if isinstance(value, str):
+            return {
+                'fw_version': value,
+                'series': DeviceSimulator.get_default_series(model)
+            }, None
+        if not isinstance(value, dict):
+            return None, None
+
+        fw_version = value.get('fw_version') or value.get('fw')
+        series = value.get('series') or DeviceSimulator.get_default_series(model)
+        if not (isinstance(fw_version, str) and isinstance(series, str)):
+            return None, None
+        entry = {
+            'fw_version': fw_version,
+            'series': series
+        }
+        payload = value.get('payload')
+        if payload is not None:
+            try:
+                validate_schema(payload, f"{model}.payload")
+            except SchemaError as e:
+                return None, str(e)
+            entry['payload'] = payload
+        return entry, None
+
+    def _models_changed(self):
+        """型號設定變更後更新版本號並重新編譯 payload 產生函式（呼叫者需持有 self.lock）"""
+        self.models_version += 1
+        self._models_snapshot = None
+        generators = {}
+        for model, entry in DeviceSimulator.DEVICE_MODELS.items():
+            if entry.get('payload') is not None:
+                try:
+                    generators[model] = compile_schema(entry['payload'], model)
+                except SchemaError:
+                    # 設定檔中無效的 schema（載入時已記錄），使用預設格式
+                    pass
+        DeviceSimulator.PAYLOAD_GENERATORS = generators
 
     def _save_models(self):
-        """儲存型號設定"""
+        """排程儲存型號設定（呼叫者需持有 self.lock）
+
+        實際寫入延遲 MODEL_SAVE_DELAY 秒後於背景執行，期間內的多次變更只寫入一次。
+        """
+        self._models_changed()
+        if self._save_timer is None:
+            self._save_timer = threading.Timer(self.MODEL_SAVE_DELAY, self.flush_models)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush_models(self):
+        """立即將尚未寫入的型號設定寫入磁碟（temp file + rename，確保檔案完整）"""
         with self.lock:
-            os.makedirs(os.path.dirname(self.model_store_path), exist_ok=True)
-            with open(self.model_store_path, 'w', encoding='utf-8') as f:
-                json.dump(DeviceSimulator.DEVICE_MODELS, f, ensure_ascii=False, indent=2)
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            version = self.models_version
+            models = dict(DeviceSimulator.DEVICE_MODELS)
+
+        with self._save_lock:
+            if version <= self._saved_version:
+                return
+            directory = os.path.dirname(self.model_store_path)
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix='.models-', suffix='.json', dir=directory)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(models, f, ensure_ascii=False, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                # mkstemp 建立的檔案權限為 0600，沿用原檔權限（無原檔時依 umask）
+                os.chmod(tmp_path, self._model_file_mode())
+                os.replace(tmp_path, self.model_store_path)
+            except Exception as e:
+                print(f"[{datetime.now()}] 儲存型號設定失敗: {type(e).__name__}: {e}")
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                return
+            self._saved_version = version
+
+    def _model_file_mode(self):
+        try:
+            return os.stat(self.model_store_path).st_mode & 0o777
+        except OSError:
+            return DEFAULT_FILE_MODE
+
+    def _devices_changed(self):
+        """設備列表或設備狀態變更時更新版本號（itertools.count 的 next 為原子操作，不需持有鎖）"""
+        self.devices_version = next(self._devices_version_counter)
+
+    def get_models_etag(self):
+        """取得型號設定的 ETag"""
+        return f"{self.instance_id}-m{self.models_version}"
+
+    def get_devices_etag(self):
+        """取得設備列表的 ETag"""
+        return f"{self.instance_id}-d{self.devices_version}"
     
     def generate_mac(self):
         """生成唯一的 MAC 地址"""
@@ -281,8 +514,9 @@ class DeviceManager:
             # 如果已存在，使用隨機生成
             return self.generate_mac()
     
-    def add_device(self, model, fw_version=None, mac=None, use_sequential=False):
-        """新增設備"""
+    def add_device(self, model, fw_version=None, mac=None, use_sequential=False,
+                   data_interval=None, heartbeat_interval=None, jitter=None):
+        """新增設備（data_interval / heartbeat_interval / jitter 未指定時使用預設 60 / 60 / 10 秒）"""
         with self.lock:
             # 檢查設備數量限制（最多 100 台）
             if len(self.devices) >= 100:
@@ -309,6 +543,12 @@ class DeviceManager:
             else:
                 self.used_macs.add(mac)
             
+            # 依 MAC 分配 Broker
+            endpoint = self.pool.assign(mac)
+            if endpoint is None:
+                self.used_macs.discard(mac)
+                return None, "所有 Broker 皆已達連線上限或排空中，無法新增"
+            
             # 建立設備
             device_id = f"device_{self.device_counter}"
             self.device_counter += 1
@@ -318,14 +558,25 @@ class DeviceManager:
                 mac=mac,
                 model=model,
                 fw_version=fw_version,
-                broker=self.broker,
-                port=self.port,
+                broker=endpoint.host,
+                port=endpoint.port,
                 series=series,
                 username=self.username,
-                password=self.password
+                password=self.password,
+                tls_context=self.tls_context
             )
+            if data_interval is not None:
+                device.data_interval = data_interval
+            if heartbeat_interval is not None:
+                device.heartbeat_interval = heartbeat_interval
+            if jitter is not None:
+                device.jitter = jitter
+            device.probe = self.probe
+            device.endpoint = endpoint
+            device.on_state_change = self._devices_changed
             
             self.devices[device_id] = device
+            self._devices_changed()
             return device_id, None
     
     def remove_device(self, device_id):
@@ -337,7 +588,9 @@ class DeviceManager:
             device = self.devices[device_id]
             device.stop()
             self.used_macs.discard(device.mac)
+            self.pool.release(device.mac)
             del self.devices[device_id]
+            self._devices_changed()
             return True, None
     
     def start_device(self, device_id):
@@ -423,7 +676,9 @@ class DeviceManager:
         with self.lock:
             for device in devices_snapshot:
                 self.used_macs.discard(device.mac)
+                self.pool.release(device.mac)
             self.devices.clear()
+            self._devices_changed()
         
         return count
     
@@ -482,12 +737,131 @@ class DeviceManager:
             return None
         return self.devices[device_id].get_status()
     
+    def rebalance(self):
+        """依目前 Broker 設定重新平衡設備，回傳移動的設備數"""
+        with self.lock:
+            by_mac = {device.mac: device for device in self.devices.values()}
+            moves = self.pool.rebalance(by_mac.keys())
+        
+        if not moves:
+            return 0
+        
+        # 使用執行緒池並行移動設備（重新連線為網路 I/O，不在鎖內進行）
+        futures = [self.executor.submit(by_mac[mac].move_to, endpoint) for mac, endpoint in moves]
+        for future in futures:
+            try:
+                future.result(timeout=10)
+            except Exception as e:
+                print(f"移動設備時出錯: {e}")
+        
+        return len(moves)
+
+    def add_broker(self, data):
+        """新增 Broker 端點並重新平衡，回傳 (移動設備數, 錯誤訊息)"""
+        try:
+            endpoint = BrokerEndpoint.from_dict(data)
+            with self.lock:
+                self.pool.add(endpoint)
+        except ValueError as e:
+            return 0, str(e)
+        if self.probe is not None:
+            self.probe.add_endpoint(endpoint)
+        return self.rebalance(), None
+
+    def drain_broker(self, name):
+        """排空 Broker 端點（設備移至其他端點），回傳 (移動設備數, 錯誤訊息)"""
+        try:
+            with self.lock:
+                self.pool.drain(name)
+        except ValueError as e:
+            return 0, str(e)
+        return self.rebalance(), None
+
+    def remove_broker(self, name):
+        """移除已排空的 Broker 端點"""
+        try:
+            with self.lock:
+                self.pool.remove(name)
+        except ValueError as e:
+            return False, str(e)
+        if self.probe is not None:
+            self.probe.remove_endpoint(name)
+        return True, None
+
+    def get_broker_stats(self):
+        """取得各 Broker 的分配、連線與吞吐量統計"""
+        with self.lock:
+            endpoints = list(self.pool.endpoints.values())
+            devices_snapshot = list(self.devices.values())
+        connected = {}
+        for device in devices_snapshot:
+            if device.connected and device.endpoint is not None:
+                connected[device.endpoint.name] = connected.get(device.endpoint.name, 0) + 1
+        return [endpoint.get_stats(connected.get(endpoint.name, 0)) for endpoint in endpoints]
+
+    def get_tls_stats(self):
+        """取得 TLS 握手統計（未啟用 TLS 時回傳 enabled=False）"""
+        if self.tls_context is None:
+            return {'enabled': False}
+        return {'enabled': True, **self.tls_context.get_stats()}
+
+    def enable_probe(self):
+        """啟用端到端探測模式（啟動本地訂閱者並讓所有設備附加探測欄位）"""
+        if self.probe is None:
+            # 連線為網路 I/O，不在鎖內進行
+            with self.lock:
+                endpoints = list(self.pool.endpoints.values())
+            probe = ProbeMonitor(endpoints, self.username, self.password, self.tls_context)
+            if not probe.start():
+                return False, "探測器啟動失敗"
+            with self.lock:
+                if self.probe is None:
+                    self.probe = probe
+                    probe = None
+            if probe is not None:
+                probe.stop()
+        with self.lock:
+            for device in self.devices.values():
+                device.probe = self.probe
+        return True, None
+
+    def disable_probe(self):
+        """停用端到端探測模式"""
+        with self.lock:
+            probe = self.probe
+            self.probe = None
+            for device in self.devices.values():
+                device.probe = None
+        if probe is not None:
+            probe.stop()
+        return True, None
+
+    def reset_probe(self):
+        """清除探測統計"""
+        if self.probe is None:
+            return False, "探測模式未啟用"
+        self.probe.reset()
+        return True, None
+
+    def get_probe_stats(self):
+        """取得探測統計（未啟用時回傳 enabled=False）"""
+        probe = self.probe
+        if probe is None:
+            return {'enabled': False, 'models': {}}
+        return {'enabled': True, **probe.get_stats()}
+    
     def get_supported_models(self):
-        """取得支援的設備型號"""
-        return dict(DeviceSimulator.DEVICE_MODELS)
+        """取得支援的設備型號（回傳依版本快取的唯讀快照，請勿修改）"""
+        snapshot = self._models_snapshot
+        if snapshot is None:
+            with self.lock:
+                if self._models_snapshot is None:
+                    self._models_snapshot = dict(DeviceSimulator.DEVICE_MODELS)
+                snapshot = self._models_snapshot
+        return snapshot
 
-    def add_model(self, model, fw_version, series=None):
-        """新增支援的設備型號"""
+    def add_model(self, model, fw_version, series=None, payload=None):
+        """新增支援的設備型號（payload 為選填的感測器數據 schema）"""
         model = (model or '').strip()
         fw_version = (fw_version or '').strip()
         series = (series or '').strip()
@@ -497,11 +871,18 @@ class DeviceManager:
             return False, "韌體版本不可為空"
         if not series:
             series = DeviceSimulator.get_default_series(model)
+        entry = {
+            'fw_version': fw_version,
+            'series': series
+        }
+        if payload is not None:
+            try:
+                validate_schema(payload, f"{model}.payload")
+            except SchemaError as e:
+                return False, f"payload schema 格式錯誤: {e}"
+            entry['payload'] = payload
         with self.lock:
-            DeviceSimulator.DEVICE_MODELS[model] = {
-                'fw_version': fw_version,
-                'series': series
-            }
+            DeviceSimulator.DEVICE_MODELS[model] = entry
             self._save_models()
         return True, None
 
@@ -526,19 +907,11 @@ class DeviceManager:
 
         normalized = {}
         for model, value in models.items():
-            if isinstance(value, str):
-                normalized[model] = {
-                    'fw_version': value,
-                    'series': DeviceSimulator.get_default_series(model)
-                }
-            elif isinstance(value, dict):
-                fw_version = value.get('fw_version') or value.get('fw')
-                series = value.get('series') or DeviceSimulator.get_default_series(model)
-                if isinstance(fw_version, str) and isinstance(series, str):
-                    normalized[model] = {
-                        'fw_version': fw_version,
-                        'series': series
-                    }
+            entry, error = self._normalize_model_entry(model, value)
+            if error:
+                return False, f"payload schema 格式錯誤: {error}"
+            if entry:
+                normalized[model] = entry
 
         if not normalized:
             return False, "匯入資料格式不正確"
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""延遲統計共用函式（探測器、Broker 端點、TLS 握手與壓力測試摘要共用）"""
+import math
+
+
+def percentile(sorted_values, pct):
+    """取已排序數列的百分位數（nearest-rank），空數列回傳 None"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return round(sorted_values[index], 3)
+
+
+def latency_summary(values, percentiles=(50, 99)):
+    """彙整延遲樣本（毫秒）為 {samples, min, p50, p99, ..., max}
+
+    百分位數欄位名稱去掉小數點，例如 99.9 -> 'p999'。
+    """
+    latencies = sorted(values)
+    summary = {
+        'samples': len(latencies),
+        'min': round(latencies[0], 3) if latencies else None
+    }
+    for pct in percentiles:
+        summary['p' + str(pct).replace('.', '')] = percentile(latencies, pct)
+    summary['max'] = round(latencies[-1], 3) if latencies else None
+    return summary
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""感測器數據 payload schema - 驗證並編譯成產生函式
+
+schema 為與 payload 相同結構的巢狀 dict:
+- 不含 "type" 的 dict 視為巢狀物件
+- 純量值 (數字、字串、布林、null) 或 list 視為常數
+- 含 "type" 的 dict 為欄位定義:
+    {"type": "const", "value": 0}
+    {"type": "int", "min": 50, "max": 60}
+    {"type": "float", "min": 20.0, "max": 30.0, "precision": 2}
+    {"type": "int" | "float", "distribution": "normal", "mean": 25, "stddev": 2, "min": 0, "max": 50}
+    {"type": "choice", "values": [0, 1, 2]}
+    {"type": "bool", "probability": 0.5}
+    {"type": "timestamp"}
+
+編譯時產生單一 return 運算式的 Python 函式，數值常數直接內嵌、
+亂數函式以預設參數綁定為區域變數，每次產生不需再走訪 schema。
+"""
+import json
+import random
+import time
+import sys
+import os
+import math
+
+
+class SchemaError(ValueError):
+    """payload schema 格式錯誤"""
+
+
+FIELD_TYPES = ('const', 'int', 'float', 'choice', 'bool', 'timestamp')
+DISTRIBUTIONS = ('uniform', 'normal')
+MAX_PRECISION = 10
+
+# 與 DeviceSimulator.build_default_payload() 等價的 schema，用於效能比較與範例
+REFERENCE_SCHEMA = {
+    "data": {
+        "ts": 0,
+        "t": {"type": "float", "min": 20.0, "max": 30.0, "precision": 2},
+        "h": {"type": "float", "min": 40.0, "max": 80.0, "precision": 2},
+        "ct": {"type": "float", "min": 20.0, "max": 35.0, "precision": 2},
+        "ch": {"type": "float", "min": 50.0, "max": 70.0, "precision": 2},
+        "p1": 0,
+        "p25": 0,
+        "p10": 0,
+        "v": {"type": "int", "min": 50, "max": 60},
+        "vl": 0,
+        "c": {"type": "int", "min": 900, "max": 1000},
+        "ec": {"type": "int", "min": 450, "max": 550},
+        "rs": {"type": "int", "min": -50, "max": -40},
+        "lv": 0
+    },
+    "data1": {
+        "P750": {"type": "int", "min": 1, "max": 10},
+        "AHT25": 1,
+        "SCD4x": 1,
+        "op": 1,
+        "rset": 500,
+        "speed": 0,
+        "alarm": 0,
+        "rpm": {"type": "int", "min": 500, "max": 700},
+        "sa": 10
+    }
+}
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _require_number(spec, key, path, integer=False):
+    value = spec.get(key)
+    if not _is_number(value) or (integer and not isinstance(value, int)):
+        kind = '整數' if integer else '數值'
+        raise SchemaError(f"{path}: '{key}' 必須為{kind}")
+    return value
+
+
+def _validate_field(spec, path):
+    field_type = spec.get('type')
+    if field_type not in FIELD_TYPES:
+        raise SchemaError(f"{path}: 不支援的欄位類型 {field_type!r}")
+
+    if field_type == 'const':
+        if 'value' not in spec:
+            raise SchemaError(f"{path}: const 欄位缺少 'value'")
+    elif field_type in ('int', 'float'):
+        integer = field_type == 'int'
+        distribution = spec.get('distribution', 'uniform')
+        if distribution not in DISTRIBUTIONS:
+            raise SchemaError(f"{path}: 不支援的分佈 {distribution!r}")
+        if distribution == 'uniform':
+            low = _require_number(spec, 'min', path, integer)
+            high = _require_number(spec, 'max', path, integer)
+        else:
+            _require_number(spec, 'mean', path)
+            if _require_number(spec, 'stddev', path) < 0:
+                raise SchemaError(f"{path}: 'stddev' 不可為負數")
+            low = _require_number(spec, 'min', path, integer) if 'min' in spec else None
+            high = _require_number(spec, 'max', path, integer) if 'max' in spec else None
+        if low is not None and high is not None and low > high:
+            raise SchemaError(f"{path}: 'min' 不可大於 'max'")
+        if not integer and 'precision' in spec:
+            precision = spec['precision']
+            if not isinstance(precision, int) or isinstance(precision, bool) or not 0 <= precision <= MAX_PRECISION:
+                raise SchemaError(f"{path}: 'precision' 必須為 0-{MAX_PRECISION} 的整數")
+    elif field_type == 'choice':
+        values = spec.get('values')
+        if not isinstance(values, list) or not values:
+            raise SchemaError(f"{path}: choice 欄位需要非空的 'values' 陣列")
+    elif field_type == 'bool':
+        if 'probability' in spec:
+            probability = _require_number(spec, 'probability', path)
+            if not 0 <= probability <= 1:
+                raise SchemaError(f"{path}: 'probability' 必須在 0-1 之間")
+
+
+def validate_schema(schema, path='payload'):
+    """驗證 payload schema，格式錯誤時拋出 SchemaError"""
+    if not isinstance(schema, dict) or 'type' in schema:
+        raise SchemaError(f"{path}: 最外層必須為物件")
+    _validate_node(schema, path)
+
+
+def _validate_node(node, path):
+    if isinstance(node, dict):
+        if 'type' in node:
+            _validate_field(node, path)
+            return
+        for key, child in node.items():
+            if not isinstance(key, str):
+                raise SchemaError(f"{path}: 欄位名稱必須為字串")
+            _validate_node(child, f"{path}.{key}")
+    elif node is None or isinstance(node, (str, int, float, bool, list)):
+        return
+    else:
+        raise SchemaError(f"{path}: 不支援的值 {node!r}")
+
+
+class _Compiler:
+    """將 schema 轉換成 Python 運算式原始碼"""
+
+    def __init__(self):
+        self.bindings = {
+            '_uniform': random.uniform,
+            '_randint': random.randint,
+            '_gauss': random.gauss,
+            '_choice': random.choice,
+            '_random': random.random,
+            '_round': round,
+            '_int': int,
+            '_min': min,
+            '_max': max,
+            '_time': time.time,
+        }
+
+    def bind(self, value):
+        """以預設參數綁定非數值常數（避免將任意值嵌入原始碼）"""
+        name = f"_c{len(self.bindings)}"
+        self.bindings[name] = value
+        return name
+
+    @staticmethod
+    def literal(number):
+        return repr(number)
+
+    def constant(self, value):
+        if value is None or isinstance(value, bool):
+            return repr(value)
+        if _is_number(value):
+            return self.literal(value)
+        return self.bind(value)
+
+    def clamp(self, expr, spec):
+        if 'min' in spec:
+            expr = f"_max({self.literal(spec['min'])}, {expr})"
+        if 'max' in spec:
+            expr = f"_min({self.literal(spec['max'])}, {expr})"
+        return expr
+
+    def field(self, spec):
+        field_type = spec['type']
+        if field_type == 'const':
+            return self.constant(spec['value'])
+        if field_type == 'timestamp':
+            return '_int(_time())'
+        if field_type == 'bool':
+            return f"(_random() < {self.literal(spec.get('probability', 0.5))})"
+        if field_type == 'choice':
+            return f"_choice({self.bind(tuple(spec['values']))})"
+
+        normal = spec.get('distribution', 'uniform') == 'normal'
+        if field_type == 'int':
+            if normal:
+                expr = f"_int(_round(_gauss({self.literal(spec['mean'])}, {self.literal(spec['stddev'])})))"
+                return self.clamp(expr, spec)
+            return f"_randint({self.literal(spec['min'])}, {self.literal(spec['max'])})"
+
+        if normal:
+            expr = self.clamp(f"_gauss({self.literal(spec['mean'])}, {self.literal(spec['stddev'])})", spec)
+        else:
+            expr = f"_uniform({self.literal(float(spec['min']))}, {self.literal(float(spec['max']))})"
+        if 'precision' in spec:
+            expr = f"_round({expr}, {spec['precision']})"
+        return expr
+
+    def node(self, node):
+        if isinstance(node, dict):
+            if 'type' in node:
+                return self.field(node)
+            items = ', '.join(f"{key!r}: {self.node(child)}" for key, child in node.items())
+            return '{' + items + '}'
+        return self.constant(node)
+
+
+def compile_schema(schema, name='payload'):
+    """驗證並編譯 schema，回傳無參數的 payload 產生函式"""
+    validate_schema(schema, name)
+    compiler = _Compiler()
+    body = compiler.node(schema)
+    params = ', '.join(f"{key}={key}" for key in compiler.bindings)
+    source = f"def generate({params}):\n    return {body}\n"
+    namespace = dict(compiler.bindings)
+    exec(compile(source, f"<payload schema {name}>", 'exec'), namespace)
+    generate = namespace['generate']
+    generate.source = source
+    return generate
+
+
+def benchmark(generator, iterations=100000):
+    """量測產生函式每秒可產生的 payload 數"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        generator()
+    elapsed = time.perf_counter() - start
+    return iterations / elapsed if elapsed > 0 else float('inf')
+
+
+if __name__ == '__main__':
+    # 用法: python payload_schema.py [models.json] [iterations]
+    from device_manager import DeviceSimulator
+
+    store_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), 'data', 'models.json')
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+
+    results = {
+        '(hand-written ZP2)': benchmark(DeviceSimulator.build_default_payload, iterations),
+        '(compiled ZP2 reference)': benchmark(compile_schema(REFERENCE_SCHEMA, 'reference'), iterations),
+    }
+    with open(store_path, 'r', encoding='utf-8') as f:
+        models = json.load(f)
+    for model, value in models.items():
+        if isinstance(value, dict) and value.get('payload') is not None:
+            results[model] = benchmark(compile_schema(value['payload'], model), iterations)
+
+    for label, rate in results.items():
+        print(f"{label:<28} {rate:>12,.0f} payloads/s")
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+import paho.mqtt.client as mqtt
+import json
+import time
+from datetime import datetime
+import threading
+from collections import deque
+import secrets
+from latency_stats import latency_summary
+
+
+class ProbeMonitor:
+    """端到端探測器 - 訂閱設備發送的數據，計算遺失、重複、亂序與延遲
+
+    探測模式下，設備會在感測器數據中附加:
+        "probe": {"seq": <設備序號>, "ts": <發送時間 (epoch 秒)>}
+    本地訂閱者（每個 Broker 一個連線）收到後依 MAC 對應回型號，
+    按型號與 Broker 彙整統計。Broker 組成叢集時同一則訊息會被多個訂閱者收到，
+    因此只計入設備所屬 Broker 的訂閱者收到的訊息。
+    """
+
+    # 每個型號保留的延遲樣本數（用於計算百分位數）
+    LATENCY_SAMPLES = 10000
+    # 延遲統計輸出的百分位數
+    PERCENTILES = (50, 99, 99.9)
+    # 每台設備用於判斷重複的序號視窗大小
+    SEQ_WINDOW = 1024
+    # 發送後多久內的訊息視為仍在傳輸中，不計入遺失（秒）
+    IN_FLIGHT_WINDOW = 5
+    # 訂閱所有 {系列}/{MAC}/data topic
+    TOPIC_FILTER = '+/+/data'
+
+    def __init__(self, endpoints, username='', password='', tls_context=None):
+        self.username = username
+        self.password = password
+        self.tls_context = tls_context
+        self.lock = threading.Lock()
+        self.running = False
+        self.endpoints = {}
+        self.clients = {}
+        self.connected = set()
+        for endpoint in endpoints:
+            self.endpoints[endpoint.name] = endpoint
+        self._reset_state()
+
+    def _reset_state(self):
+        self.started_at = time.time()
+        self.device_stats = {}
+        self.model_stats = {}
+        self.broker_latencies = {}
+
+    def _new_model_stats(self):
+        return {
+            'sent': 0,
+            'received': 0,
+            'duplicates': 0,
+            'reordered': 0,
+            'latencies': deque(maxlen=self.LATENCY_SAMPLES)
+        }
+
+    def on_connect(self, client, userdata, flags, rc):
+        # userdata 為 Broker 名稱
+        if rc == 0:
+            self.connected.add(userdata)
+            client.subscribe(self.TOPIC_FILTER, qos=0)
+            print(f"[{datetime.now()}] 探測器已連線到 {userdata}，訂閱 {self.TOPIC_FILTER}")
+        else:
+            self.connected.discard(userdata)
+            print(f"[{datetime.now()}] 探測器連線 {userdata} 失敗，回傳碼: {rc}")
+
+    def on_disconnect(self, client, userdata, rc):
+        self.connected.discard(userdata)
+        print(f"[{datetime.now()}] 探測器與 {userdata} 已斷線")
+
+    def on_message(self, client, userdata, msg):
+        received_at = time.time()
+        # 先以位元組快速過濾，避免解析版本資訊與心跳
+        if b'"probe"' not in msg.payload:
+            return
+        try:
+            probe = json.loads(msg.payload)['probe']
+            seq = int(probe['seq'])
+            sent_at = float(probe['ts'])
+        except (ValueError, KeyError, TypeError):
+            return
+        parts = msg.topic.split('/')
+        if len(parts) != 3:
+            return
+        self.record_received(parts[1], seq, sent_at, received_at, userdata)
+
+    def record_sent(self, mac, model, seq, broker=None):
+        """記錄設備端已發送的探測訊息（broker 為設備所屬的 Broker 名稱）"""
+        now = time.monotonic()
+        with self.lock:
+            device = self.device_stats.get(mac)
+            if device is None or seq <= device['last_seq']:
+                # 新設備（或同一 MAC 的設備重新建立、序號從頭開始）
+                device = self.device_stats[mac] = {
+                    'first_seq': seq,
+                    'last_seq': seq,
+                    'settled_seq': seq - 1,
+                    'recent': deque(),
+                    'max_seq': None,
+                    'unique': 0,
+                    'seen': set()
+                }
+            device['model'] = model
+            device['broker'] = broker
+            device['last_seq'] = seq
+            device['recent'].append((now, seq))
+            self._settle(device, now)
+            stats = self.model_stats.get(model)
+            if stats is None:
+                stats = self.model_stats[model] = self._new_model_stats()
+            stats['sent'] += 1
+
+    def _settle(self, device, now):
+        """將發送超過 IN_FLIGHT_WINDOW 秒的序號視為已結算，回傳已結算的最大序號"""
+        recent = device['recent']
+        floor = now - self.IN_FLIGHT_WINDOW
+        while recent and recent[0][0] <= floor:
+            device['settled_seq'] = recent.popleft()[1]
+        return device['settled_seq']
+
+    def record_received(self, mac, seq, sent_at, received_at, broker=None):
+        """記錄訂閱端收到的探測訊息（broker 為收到訊息的訂閱者所連線的 Broker）"""
+        with self.lock:
+            device = self.device_stats.get(mac)
+            if device is None or seq < device['first_seq'] or seq > device['last_seq']:
+                # 非本模擬器發送（或重置前發送）的訊息
+                return
+            assigned = device['broker']
+            if broker is not None and assigned is not None and broker != assigned:
+                # 叢集中其他 Broker 轉送的副本，由設備所屬 Broker 的訂閱者計入
+                return
+            stats = self.model_stats[device['model']]
+            stats['received'] += 1
+
+            if seq in device['seen']:
+                stats['duplicates'] += 1
+                return
+
+            if device['max_seq'] is not None and seq < device['max_seq']:
+                stats['reordered'] += 1
+            else:
+                device['max_seq'] = seq
+                floor = seq - self.SEQ_WINDOW
+                if len(device['seen']) > self.SEQ_WINDOW:
+                    device['seen'] = {s for s in device['seen'] if s > floor}
+
+            device['seen'].add(seq)
+            device['unique'] += 1
+            latency = (received_at - sent_at) * 1000.0
+            stats['latencies'].append(latency)
+            if assigned is not None:
+                latencies = self.broker_latencies.get(assigned)
+                if latencies is None:
+                    latencies = self.broker_latencies[assigned] = deque(maxlen=self.LATENCY_SAMPLES)
+                latencies.append(latency)
+
+    def get_stats(self):
+        """取得各型號的探測統計
+
+        lost 以發送端記錄的序號範圍計算：從第一則發送的訊息到 IN_FLIGHT_WINDOW 秒前
+        發送的最後一則訊息為止，未收到的皆計為遺失，尚在傳輸中的尾端訊息不計入。
+        """
+        now = time.monotonic()
+        with self.lock:
+            lost_by_model = {}
+            expected_by_model = {}
+            for device in self.device_stats.values():
+                settled = self._settle(device, now)
+                expected = settled - device['first_seq'] + 1
+                # 已收到但尚未結算的尾端訊息不計入
+                received = device['unique'] - sum(1 for s in device['seen'] if s > settled)
+                lost = max(0, expected - received)
+                model = device['model']
+                lost_by_model[model] = lost_by_model.get(model, 0) + lost
+                expected_by_model[model] = expected_by_model.get(model, 0) + expected
+
+            models = {}
+            for model, stats in self.model_stats.items():
+                lost = lost_by_model.get(model, 0)
+                expected = expected_by_model.get(model, 0)
+                models[model] = {
+                    'sent': stats['sent'],
+                    'received': stats['received'],
+                    'lost': lost,
+                    'loss_rate': round(lost / expected, 6) if expected else 0.0,
+                    'duplicates': stats['duplicates'],
+                    'reordered': stats['reordered'],
+                    'latency_ms': latency_summary(stats['latencies'], self.PERCENTILES)
+                }
+
+            brokers = {
+                name: {'latency_ms': latency_summary(latencies, self.PERCENTILES)}
+                for name, latencies in self.broker_latencies.items()
+            }
+
+            return {
+                'running': self.running,
+                'connected': sorted(self.connected),
+                'since': datetime.fromtimestamp(self.started_at).isoformat(),
+                'models': models,
+                'brokers': brokers
+            }
+
+    def reset(self):
+        """清除所有統計"""
+        with self.lock:
+            self._reset_state()
+
+    def _connect(self, endpoint):
+        client = mqtt.Client(client_id=f"probe_{secrets.token_hex(4)}", userdata=endpoint.name)
+        client.on_connect = self.on_connect
+        client.on_disconnect = self.on_disconnect
+        client.on_message = self.on_message
+        if self.username:
+            client.username_pw_set(self.username, self.password)
+        if self.tls_context is not None:
+            client.tls_set_context(self.tls_context)
+        client.connect(endpoint.host, endpoint.port, 60)
+        client.loop_start()
+        self.clients[endpoint.name] = client
+
+    def add_endpoint(self, endpoint):
+        """新增要訂閱的 Broker（執行中時立即連線）"""
+        self.endpoints[endpoint.name] = endpoint
+        if self.running:
+            try:
+                self._connect(endpoint)
+            except Exception as e:
+                print(f"[{datetime.now()}] 探測器連線 {endpoint.name} 失敗: {type(e).__name__}: {e}")
+
+    def remove_endpoint(self, name):
+        """移除 Broker 訂閱"""
+        self.endpoints.pop(name, None)
+        client = self.clients.pop(name, None)
+        if client is not None:
+            client.loop_stop()
+            client.disconnect()
+
+    def start(self):
+        """啟動訂閱端（連線到每個 Broker）"""
+        if self.running:
+            return True
+
+        try:
+            for endpoint in self.endpoints.values():
+                self._connect(endpoint)
+            self.running = True
+            return True
+        except Exception as e:
+            print(f"[{datetime.now()}] 探測器啟動失敗: {type(e).__name__}: {e}")
+            self._disconnect_all()
+            return False
+
+    def _disconnect_all(self):
+        for client in self.clients.values():
+            client.loop_stop()
+            client.disconnect()
+        self.clients = {}
+        self.connected = set()
+
+    def stop(self):
+        """停止訂閱端"""
+        if not self.running:
+            return
+
+        self.running = False
+        self._disconnect_all()
+        print(f"[{datetime.now()}] 探測器已停止")
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+import sys
+import os
+import time
+from datetime import datetime
+import threading
+import traceback
+import tracemalloc
+import math
+
+# 以執行緒 CPU 時間判斷是否閒置（Linux 等 POSIX 平台）；不支援時改為 wall-clock 取樣
+_cpu_clock_id = getattr(time, 'pthread_getcpuclockid', None)
+
+
+class Profiler:
+    """執行中模擬器的診斷工具 - 取樣式 CPU 分析、tracemalloc 快照與執行緒堆疊
+
+    未啟動時不建立任何執行緒、不啟用 tracemalloc，因此停用時幾乎沒有額外負擔。
+    每次分析都有時間上限，逾時自動停止。
+    """
+
+    # 單次分析最長時間（秒）
+    MAX_DURATION = 300
+    # 取樣間隔範圍（秒）
+    MIN_INTERVAL = 0.001
+    DEFAULT_INTERVAL = 0.01
+    # tracemalloc 每筆配置保留的堆疊深度上限
+    MAX_TRACE_FRAMES = 25
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._cpu_stop = None
+        self._cpu_thread = None
+        self._cpu_stacks = {}
+        self._cpu_info = None
+        self._memory_timer = None
+        self._memory_baseline = None
+        self._memory_final = None
+        self._memory_info = None
+
+    # ---------- CPU 取樣 ----------
+
+    @staticmethod
+    def _frame_label(frame):
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    @staticmethod
+    def _thread_cpu_time(ident):
+        """取得執行緒已使用的 CPU 時間（秒），平台不支援時回傳 None"""
+        if _cpu_clock_id is None:
+            return None
+        try:
+            return time.clock_gettime(_cpu_clock_id(ident))
+        except (OSError, OverflowError):
+            # 執行緒已結束
+            return None
+
+    def _sample_loop(self, stop_event, interval, deadline):
+        own_ident = threading.get_ident()
+        samples = 0
+        # 各執行緒上次取樣時的 CPU 時間；只記錄兩次取樣之間有使用 CPU 的執行緒，
+        # 略過停在 Event.wait / select 等待中的發送執行緒與 paho 網路迴圈
+        cpu_times = {}
+        try:
+            while not stop_event.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own_ident:
+                        continue
+                    used = self._thread_cpu_time(ident)
+                    if used is not None:
+                        previous = cpu_times.get(ident)
+                        cpu_times[ident] = used
+                        if previous is None or used <= previous:
+                            continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(self._frame_label(frame))
+                        frame = frame.f_back
+                    stack.append(names.get(ident, str(ident)))
+                    key = ';'.join(reversed(stack))
+                    self._cpu_stacks[key] = self._cpu_stacks.get(key, 0) + 1
+                samples += 1
+                # 不超過截止時間，確保分析時間有上限
+                stop_event.wait(min(interval, deadline - time.monotonic()))
+        finally:
+            with self.lock:
+                self._cpu_info['samples'] = samples
+                self._cpu_info['finished_at'] = datetime.now().isoformat()
+                self._cpu_thread = None
+        print(f"[{datetime.now()}] CPU 取樣分析結束，共 {samples} 次取樣")
+
+    def start_cpu(self, duration=30, interval=DEFAULT_INTERVAL):
+        """開始取樣式 CPU 分析（duration 秒後自動停止）"""
+        try:
+            duration = float(duration)
+            interval = float(interval)
+        except (TypeError, ValueError):
+            return False, "參數格式不正確"
+        if not (math.isfinite(duration) and math.isfinite(interval)):
+            return False, "參數格式不正確"
+        if duration <= 0 or duration > self.MAX_DURATION:
+            return False, f"分析時間必須在 0-{self.MAX_DURATION} 秒之間"
+        interval = min(max(self.MIN_INTERVAL, interval), duration)
+
+        with self.lock:
+            if self._cpu_thread is not None:
+                return False, "CPU 分析已在執行中"
+            self._cpu_stacks = {}
+            self._cpu_info = {
+                'started_at': datetime.now().isoformat(),
+                'finished_at': None,
+                'duration': duration,
+                'interval': interval,
+                'mode': 'cpu' if _cpu_clock_id is not None else 'wall',
+                'samples': 0
+            }
+            self._cpu_stop = threading.Event()
+            self._cpu_thread = threading.Thread(
+                target=self._sample_loop,
+                args=(self._cpu_stop, interval, time.monotonic() + duration),
+                name='ProfilerSampler',
+                daemon=True
+            )
+            self._cpu_thread.start()
+        print(f"[{datetime.now()}] CPU 取樣分析開始（{duration} 秒，間隔 {interval} 秒）")
+        return True, None
+
+    def stop_cpu(self):
+        """提前停止 CPU 分析"""
+        with self.lock:
+            thread = self._cpu_thread
+            if thread is None:
+                return False, "CPU 分析未在執行"
+            self._cpu_stop.set()
+        thread.join()
+        return True, None
+
+    def get_cpu_result(self):
+        """取得 CPU 分析結果（collapsed stack 格式，可直接交給 flamegraph.pl / speedscope）"""
+        with self.lock:
+            if self._cpu_info is None:
+                return None
+            stacks = dict(self._cpu_stacks)
+        lines = [f"{stack} {count}" for stack, count in sorted(stacks.items(), key=lambda item: -item[1])]
+        return '\n'.join(lines) + '\n'
+
+    # ---------- 記憶體 ----------
+
+    def _finish_memory(self):
+        with self.lock:
+            if self._memory_timer is None:
+                return False
+            self._memory_timer.cancel()
+            self._memory_timer = None
+            self._memory_final = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            self._memory_info['finished_at'] = datetime.now().isoformat()
+        print(f"[{datetime.now()}] 記憶體分析結束")
+        return True
+
+    def start_memory(self, duration=60, frames=10):
+        """開始 tracemalloc 記憶體分析（duration 秒後自動拍攝結束快照）"""
+        try:
+            duration = float(duration)
+            frames = int(frames)
+        except (TypeError, ValueError):
+            return False, "參數格式不正確"
+        if not math.isfinite(duration):
+            return False, "參數格式不正確"
+        if duration <= 0 or duration > self.MAX_DURATION:
+            return False, f"分析時間必須在 0-{self.MAX_DURATION} 秒之間"
+        frames = min(max(1, frames), self.MAX_TRACE_FRAMES)
+
+        with self.lock:
+            if self._memory_timer is not None:
+                return False, "記憶體分析已在執行中"
+            if tracemalloc.is_tracing():
+                return False, "tracemalloc 已由其他程式啟用"
+            tracemalloc.start(frames)
+            self._memory_baseline = tracemalloc.take_snapshot()
+            self._memory_final = None
+            self._memory_info = {
+                'started_at': datetime.now().isoformat(),
+                'finished_at': None,
+                'duration': duration,
+                'frames': frames
+            }
+            self._memory_timer = threading.Timer(duration, self._finish_memory)
+            self._memory_timer.daemon = True
+            self._memory_timer.start()
+        print(f"[{datetime.now()}] 記憶體分析開始（{duration} 秒）")
+        return True, None
+
+    def stop_memory(self):
+        """提前停止記憶體分析"""
+        if not self._finish_memory():
+            return False, "記憶體分析未在執行"
+        return True, None
+
+    def get_memory_result(self, limit=50):
+        """取得記憶體分析結果（相對於起始快照的配置差異，依大小排序）"""
+        with self.lock:
+            if self._memory_info is None:
+                return None
+            baseline = self._memory_baseline
+            # 執行中時以當下快照比較
+            final = self._memory_final or tracemalloc.take_snapshot()
+            info = dict(self._memory_info)
+
+        stats = final.compare_to(baseline, 'traceback')
+        top = []
+        for stat in stats[:limit]:
+            top.append({
+                'size_diff': stat.size_diff,
+                'size': stat.size,
+                'count_diff': stat.count_diff,
+                'count': stat.count,
+                'traceback': [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+            })
+        return {
+            **info,
+            'total_size': sum(stat.size for stat in stats),
+            'total_size_diff': sum(stat.size_diff for stat in stats),
+            'top': top
+        }
+
+    # ---------- 狀態 ----------
+
+    def get_status(self):
+        """取得分析器狀態"""
+        with self.lock:
+            return {
+                'cpu': {
+                    'running': self._cpu_thread is not None,
+                    'stacks': len(self._cpu_stacks),
+                    **(self._cpu_info or {})
+                },
+                'memory': {
+                    'running': self._memory_timer is not None,
+                    **(self._memory_info or {})
+                }
+            }
+
+
+def dump_thread_stacks():
+    """傾印所有執行緒目前的堆疊（含 paho 網路迴圈與設備發送執行緒）"""
+    frames = sys._current_frames()
+    lines = [f"# {datetime.now().isoformat()} - {len(frames)} threads"]
+    for thread in threading.enumerate():
+        frame = frames.get(thread.ident)
+        if frame is None:
+            continue
+        lines.append('')
+        lines.append(f"Thread {thread.name} (ident={thread.ident}, daemon={thread.daemon}):")
+        lines.extend(line.rstrip('\n') for line in traceback.format_stack(frame))
+    return '\n'.join(lines) + '\n'
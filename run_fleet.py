@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""無網頁介面的壓力測試執行器
+
+依 fleet spec (JSON) 建立 DeviceManager、啟動所有設備並執行指定時間，
+結束時輸出 JSON 摘要（吞吐量、連線時間、錯誤數）。不匯入 Flask，適合 CI 容器。
+
+用法:
+    python run_fleet.py fleet.json [--duration 秒] [--output summary.json] [--quiet]
+
+fleet spec 範例見 fleet.example.json。
+"""
+import argparse
+import contextlib
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+
+from latency_stats import latency_summary
+
+# fleet spec 中每組設備允許的欄位
+GROUP_KEYS = ('model', 'count', 'fw_version', 'data_interval', 'heartbeat_interval', 'jitter', 'use_sequential')
+# 與 DeviceManager.add_device 相同的設備上限
+MAX_DEVICES = 100
+
+
+class SpecError(ValueError):
+    """fleet spec 格式錯誤"""
+
+
+def _positive_number(value, name):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise SpecError(f"'{name}' 必須為正數")
+    return value
+
+
+def load_spec(path):
+    """讀取並驗證 fleet spec"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            spec = json.load(f)
+    except (OSError, ValueError) as e:
+        raise SpecError(f"無法讀取 fleet spec: {e}")
+    if not isinstance(spec, dict):
+        raise SpecError("fleet spec 必須為物件")
+
+    broker = spec.get('broker') or {}
+    if not isinstance(broker, dict):
+        raise SpecError("'broker' 必須為物件")
+    if spec.get('tls') is not None and not isinstance(spec['tls'], dict):
+        raise SpecError("'tls' 必須為物件")
+    if 'duration' in spec:
+        _positive_number(spec['duration'], 'duration')
+
+    fleet = spec.get('fleet')
+    if not isinstance(fleet, list) or not fleet:
+        raise SpecError("'fleet' 必須為非空陣列")
+    total = 0
+    for index, group in enumerate(fleet):
+        name = f"fleet[{index}]"
+        if not isinstance(group, dict):
+            raise SpecError(f"{name} 必須為物件")
+        unknown = set(group) - set(GROUP_KEYS)
+        if unknown:
+            raise SpecError(f"{name} 含未知欄位: {', '.join(sorted(unknown))}")
+        if not isinstance(group.get('model'), str) or not group['model']:
+            raise SpecError(f"{name} 缺少 'model'")
+        count = group.get('count', 1)
+        if isinstance(count, bool) or not isinstance(count, int) or count < 1:
+            raise SpecError(f"{name}.count 必須為正整數")
+        for key in ('data_interval', 'heartbeat_interval'):
+            if key in group:
+                _positive_number(group[key], f"{name}.{key}")
+        jitter = group.get('jitter', 0)
+        if isinstance(jitter, bool) or not isinstance(jitter, (int, float)) or jitter < 0:
+            raise SpecError(f"{name}.jitter 必須為非負數")
+        total += count
+    if total > MAX_DEVICES:
+        raise SpecError(f"設備總數 {total} 超過上限 {MAX_DEVICES}")
+    return spec
+
+
+def build_manager(spec):
+    """依 fleet spec 建立 DeviceManager（延遲匯入，讓 --help 與 spec 錯誤能快速回報）"""
+    if spec.get('model_store'):
+        os.environ['MODEL_STORE_PATH'] = spec['model_store']
+    from device_manager import DeviceManager
+
+    broker = spec.get('broker') or {}
+    return DeviceManager(
+        broker=broker.get('host', os.getenv('MQTT_BROKER', 'localhost')),
+        port=int(broker.get('port', os.getenv('MQTT_PORT', 1883))),
+        username=broker.get('username', os.getenv('MQTT_USERNAME', '')),
+        password=broker.get('password', os.getenv('MQTT_PASSWORD', '')),
+        probe_enabled=bool(spec.get('probe', False)),
+        brokers=spec.get('brokers'),
+        tls=spec.get('tls')
+    )
+
+
+def build_summary(manager, started_at, elapsed, requested, add_errors, started_count):
+    """彙整執行結果"""
+    brokers = manager.get_broker_stats()
+    latencies = [
+        sample
+        for endpoint in list(manager.pool.endpoints.values())
+        for sample in endpoint.connect_latency_samples()
+    ]
+    messages = sum(b['messages'] for b in brokers)
+    devices = manager.get_all_status()
+
+    return {
+        'started_at': started_at.isoformat(),
+        'elapsed_s': round(elapsed, 3),
+        'devices': {
+            'requested': requested,
+            'created': len(devices),
+            'started': started_count,
+            'connected_at_end': sum(1 for d in devices if d['connected'])
+        },
+        'throughput': {
+            'messages': messages,
+            'bytes': sum(b['bytes'] for b in brokers),
+            'messages_per_sec': round(messages / elapsed, 3) if elapsed > 0 else 0.0
+        },
+        'connect_ms': latency_summary(latencies),
+        'errors': {
+            'add_failures': len(add_errors),
+            'start_failures': len(devices) - started_count,
+            'connect_failures': sum(b['connect_failures'] for b in brokers),
+            'disconnects': sum(b['disconnects'] for b in brokers),
+            'publish_errors': sum(b['publish_errors'] for b in brokers),
+            'messages': add_errors
+        },
+        'brokers': brokers,
+        'tls': manager.get_tls_stats(),
+        'probe': manager.get_probe_stats()
+    }
+
+
+def run(spec, duration, log):
+    """執行壓力測試並回傳摘要"""
+    stop_event = threading.Event()
+
+    def handle_signal(signum, frame):
+        print(f"[{datetime.now()}] 收到訊號 {signum}，提前結束", file=log)
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    manager = build_manager(spec)
+    requested = 0
+    add_errors = []
+    for group in spec['fleet']:
+        count = group.get('count', 1)
+        requested += count
+        for _ in range(count):
+            device_id, error = manager.add_device(
+                group['model'],
+                group.get('fw_version'),
+                use_sequential=group.get('use_sequential', True),
+                data_interval=group.get('data_interval'),
+                heartbeat_interval=group.get('heartbeat_interval'),
+                jitter=group.get('jitter')
+            )
+            if error:
+                add_errors.append(f"{group['model']}: {error}")
+
+    started_at = datetime.now()
+    start = time.monotonic()
+    started_count = manager.start_all()
+    print(f"[{datetime.now()}] 已啟動 {started_count} 台設備，執行 {duration} 秒", file=log)
+    stop_event.wait(duration)
+    elapsed = time.monotonic() - start
+
+    # 先彙整再停止，connected_at_end 才能反映執行結束時的連線狀態
+    summary = build_summary(manager, started_at, elapsed, requested, add_errors, started_count)
+    manager.stop_all()
+    manager.disable_probe()
+    manager.executor.shutdown(wait=False)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Device simulator 無網頁介面壓力測試執行器')
+    parser.add_argument('spec', help='fleet spec JSON 檔案')
+    parser.add_argument('--duration', type=float, help='執行秒數（覆寫 spec 中的 duration）')
+    parser.add_argument('--output', help='摘要輸出檔案（預設輸出到 stdout）')
+    parser.add_argument('--quiet', action='store_true', help='不輸出設備日誌（含錯誤 traceback）')
+    args = parser.parse_args(argv)
+
+    try:
+        spec = load_spec(args.spec)
+    except SpecError as e:
+        print(f"fleet spec 錯誤: {e}", file=sys.stderr)
+        return 2
+
+    duration = args.duration if args.duration is not None else spec.get('duration', 60)
+    if duration <= 0:
+        print("fleet spec 錯誤: 'duration' 必須為正數", file=sys.stderr)
+        return 2
+
+    # 設備日誌導向 stderr（或丟棄），stdout 只輸出 JSON 摘要
+    log = open(os.devnull, 'w') if args.quiet else sys.stderr
+    try:
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(contextlib.redirect_stdout(log))
+            if args.quiet:
+                # 連線失敗時設備會輸出 traceback 到 stderr，安靜模式下一併丟棄
+                stack.enter_context(contextlib.redirect_stderr(log))
+            summary = run(spec, duration, log)
+    except (ValueError, OSError) as e:
+        # Broker 清單或 TLS 憑證設定錯誤
+        print(f"fleet spec 錯誤: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if args.quiet:
+            log.close()
+
+    data = json.dumps(summary, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(data + '\n')
+    else:
+        print(data)
+
+    errors = summary['errors']
+    return 1 if errors['add_failures'] or errors['start_failures'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
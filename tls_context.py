@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+import ssl
+import time
+import threading
+from collections import deque
+from latency_stats import latency_summary
+
+
+class HandshakeStats:
+    """TLS 握手統計（次數、session 重用、握手時間）"""
+
+    LATENCY_SAMPLES = 1000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.handshakes = 0
+        self.resumed = 0
+        self.failures = 0
+        self.latencies = deque(maxlen=self.LATENCY_SAMPLES)
+        self.resumed_latencies = deque(maxlen=self.LATENCY_SAMPLES)
+
+    def record(self, elapsed, resumed):
+        with self.lock:
+            self.handshakes += 1
+            self.latencies.append(elapsed * 1000.0)
+            if resumed:
+                self.resumed += 1
+                self.resumed_latencies.append(elapsed * 1000.0)
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'handshakes': self.handshakes,
+                'resumed': self.resumed,
+                'failures': self.failures,
+                'resumption_rate': round(self.resumed / self.handshakes, 4) if self.handshakes else 0.0,
+                'handshake_ms': latency_summary(self.latencies),
+                'resumed_handshake_ms': latency_summary(self.resumed_latencies)
+            }
+
+
+class TimedSSLSocket(ssl.SSLSocket):
+    """記錄握手時間與 session 重用的 SSLSocket"""
+
+    def do_handshake(self, block=False):
+        start = time.perf_counter()
+        try:
+            super().do_handshake(block)
+        except Exception:
+            self.context.stats.record_failure()
+            raise
+        self.context.stats.record(time.perf_counter() - start, self.session_reused)
+
+
+class FleetSSLContext(ssl.SSLContext):
+    """全體設備共用的 SSLContext，依 Broker 位址快取 TLS session 供重新連線時重用
+
+    paho 每次連線都會呼叫 wrap_socket(do_handshake_on_connect=False) 再 do_handshake()，
+    在 wrap_socket 時帶入快取的 session，重新連線風暴時即可省去完整握手。
+    TLS 1.3 的 session ticket 在握手後才由 Broker 送出，因此於 MQTT CONNACK 後
+    （on_connect）再呼叫 remember_session() 儲存。
+    """
+
+    sslsocket_class = TimedSSLSocket
+
+    def __new__(cls, protocol=ssl.PROTOCOL_TLS_CLIENT, *args, **kwargs):
+        return super().__new__(cls, protocol, *args, **kwargs)
+
+    def __init__(self, protocol=ssl.PROTOCOL_TLS_CLIENT, session_resumption=True):
+        self.stats = HandshakeStats()
+        self.session_resumption = session_resumption
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+
+    @staticmethod
+    def _session_key(sock, server_hostname):
+        try:
+            host, port = sock.getpeername()[:2]
+        except OSError:
+            return None
+        return (server_hostname or host, port)
+
+    def wrap_socket(self, sock, *args, session=None, server_hostname=None, **kwargs):
+        if session is None and self.session_resumption:
+            key = self._session_key(sock, server_hostname)
+            with self._sessions_lock:
+                session = self._sessions.get(key)
+        return super().wrap_socket(sock, *args, session=session, server_hostname=server_hostname, **kwargs)
+
+    def remember_session(self, sock):
+        """儲存已連線 socket 的 TLS session（供之後的連線重用）"""
+        if not self.session_resumption or not isinstance(sock, ssl.SSLSocket):
+            return
+        session = sock.session
+        if session is None:
+            return
+        key = self._session_key(sock, sock.server_hostname)
+        if key is None:
+            return
+        with self._sessions_lock:
+            self._sessions[key] = session
+
+    def clear_sessions(self):
+        with self._sessions_lock:
+            self._sessions.clear()
+
+    def get_stats(self):
+        with self._sessions_lock:
+            cached = len(self._sessions)
+        return {
+            'session_resumption': self.session_resumption,
+            'cached_sessions': cached,
+            **self.stats.get_stats()
+        }
+
+
+def create_fleet_context(ca_certs=None, certfile=None, keyfile=None, insecure=False,
+                         ciphers=None, session_resumption=True):
+    """建立全體設備共用的 TLS context
+
+    - ca_certs: 驗證 Broker 憑證的 CA 檔案（未指定時使用系統預設 CA）
+    - certfile / keyfile: 用戶端憑證（mTLS）
+    - insecure: 不驗證 Broker 憑證與主機名稱（僅限測試，例如自簽憑證）
+    """
+    context = FleetSSLContext(session_resumption=session_resumption)
+    if ca_certs:
+        context.load_verify_locations(cafile=ca_certs)
+    else:
+        context.load_default_certs()
+    if certfile:
+        context.load_cert_chain(certfile, keyfile or None)
+    if ciphers:
+        context.set_ciphers(ciphers)
+    if insecure:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    return context